@@ -1,277 +1,504 @@
-import calendar, io
-from pathlib import Path
-import pandas as pd
-import streamlit as st
-
-# ================== PAGE CONFIG ==================
-st.set_page_config(page_title="Doctor Performance — Monthwise", layout="wide")
-st.title("Doctor Performance — Monthwise")
-
-# Centers
-CENTERS = {"easyhealth": "EasyHealth", "excellent": "Excellent"}
-
-# Storage folder to persist processed data (so View works after reload)
-BASE = Path(__file__).parent
-STORE = BASE / "processed"
-STORE.mkdir(parents=True, exist_ok=True)
-
-# ================== SESSION INIT (hydrate from disk) ==================
-def load_center_from_disk(center_key: str) -> pd.DataFrame | None:
-    f = STORE / f"{center_key}.csv"
-    if f.exists():
-        try:
-            return pd.read_csv(f)
-        except Exception:
-            return None
-    return None
-
-def save_center_to_disk(center_key: str, df: pd.DataFrame):
-    (STORE / f"{center_key}.csv").write_text(df.to_csv(index=False))
-
-if "center_data" not in st.session_state:
-    st.session_state["center_data"] = {k: load_center_from_disk(k) for k in CENTERS.keys()}
-
-# ================== HELPERS ==================
-def safe_month_label(n):
-    try:
-        n = int(float(n))
-        return calendar.month_abbr[n] if 1 <= n <= 12 else ""
-    except Exception:
-        return ""
-
-def normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [" ".join(str(c).strip().split()) for c in df.columns]
-    return df
-
-def find_col(df, *candidates):
-    """Case-insensitive exact; then heuristic for doctor/provider-like columns."""
-    wanted = {c.lower().strip(): c for c in candidates}
-    for c in df.columns:
-        if str(c).lower().strip() in wanted:
-            return c
-    for c in df.columns:
-        k = str(c).lower().replace(" ", "")
-        if any(tok in k for tok in ["docname", "doc", "doctor", "provider", "physician"]):
-            return c
-    return None
-
-@st.cache_data(show_spinner=False)
-def load_excel(file):
-    return pd.read_excel(file, sheet_name=0, engine="openpyxl")
-
-# ---------- Keyword mapping for Item Group → Bucket ----------
-CONSULTATION_KEYS = [
-    "consult", "opd", "follow up", "follow-up", "revisit", "tele", "teleconsult"
-]
-MEDICINE_KEYS = [
-    "medicine", "medicin", "drug", "pharmacy", "rx", "tablet", "capsule",
-    "syrup", "drops", "cream", "ointment", "spray", "suppository"
-]
-PROCEDURE_KEYS = [
-    "procedure", "proc", "injection", "inj", "iv", "infusion", "nebul",
-    "ecg", "dressing", "suturing", "removal", "x-ray", "xray", "ultrasound",
-    "usg", "physio", "cast", "lab sample", "venipuncture", "nebulization",
-    "ivf", "drip", "echo", "spirometry", "vaccin", "vaccine", "bandage"
-]
-
-def categorize_group(x: str) -> str:
-    if pd.isna(x):
-        return "Other"
-    s = str(x).strip().lower()
-    if any(k in s for k in CONSULTATION_KEYS):
-        return "Consultation"
-    if any(k in s for k in MEDICINE_KEYS):
-        return "Medicines"
-    if any(k in s for k in PROCEDURE_KEYS):
-        return "Procedure"
-    return "Other"
-
-# ================== CORE PROCESSOR ==================
-def process_file(df_in: pd.DataFrame) -> pd.DataFrame:
-    """
-    Month-wise doctor summary with Total & Avg_per_Visit.
-    * Sum money on ALL lines (no global drop_duplicates).
-    * Visits = distinct VisitNo per (Doc, Year, Month).
-    * Robust Item Group → Bucket mapping.
-    """
-    df = normalize_cols(df_in)
-
-    visit_col = find_col(df, "VisitNo", "Visit No", "Visit_ID", "Visit Id")
-    date_col  = find_col(df, "VisitDate", "Visit Date", "Date")
-    doc_col   = find_col(df, "DocName", "Doc Name", "Doctor", "Doctor Name", "Provider", "Provider Name")
-    group_col = find_col(df, "Item Group", "ItemGroup", "Group")
-    # prefer Net Amount if available; fallback to ActivityIns/Amount
-    amt_col   = find_col(df, "Net Amount", "NetAmount", "ActivityIns", "Activity Ins", "Amount")
-
-    missing = [label for label, col in [
-        ("VisitNo", visit_col), ("VisitDate", date_col), ("DocName", doc_col),
-        ("Item Group", group_col), ("Amount (Net/ActivityIns)", amt_col)
-    ] if col is None]
-    if missing:
-        raise ValueError(f"Missing required column(s): {missing}")
-
-    # Dates → Year/Month
-    dt = pd.to_datetime(df[date_col], errors="coerce")
-    df["Year"] = dt.dt.year
-    df["MonthNum"] = dt.dt.month.astype("Int64")
-    df["Month"] = df["MonthNum"].apply(safe_month_label)
-    bad_dates = int(df["MonthNum"].isna().sum())
-    if bad_dates > 0:
-        st.warning(f"{bad_dates} row(s) had invalid VisitDate and were excluded from month buckets.")
-
-    # Amounts and Buckets
-    df[amt_col] = pd.to_numeric(df[amt_col], errors="coerce").fillna(0)
-    df["Bucket"] = df[group_col].apply(categorize_group)
-
-    # --- AMOUNTS: sum ALL lines by Doc × Year × Month × Bucket ---
-    ok = df["MonthNum"].notna()
-    amounts = (
-        df.loc[ok]
-          .pivot_table(
-              index=[doc_col, "Year", "MonthNum", "Month"],
-              columns="Bucket",
-              values=amt_col,
-              aggfunc="sum",
-              fill_value=0,
-          )
-          .reset_index()
-    )
-    for col in ["Consultation", "Medicines", "Procedure", "Other"]:
-        if col not in amounts.columns:
-            amounts[col] = 0
-
-    # --- VISITS: distinct VisitNo per group ---
-    vdf = df.loc[ok, [doc_col, "Year", "MonthNum", "Month", visit_col]].copy()
-    vdf[visit_col] = vdf[visit_col].astype(str).str.strip()
-    visits = (
-        vdf.groupby([doc_col, "Year", "MonthNum", "Month"])[visit_col]
-           .nunique()
-           .reset_index(name="Visits")
-    )
-
-    # Merge + totals
-    out = amounts.merge(visits, on=[doc_col, "Year", "MonthNum", "Month"], how="left")
-    out["Visits"] = out["Visits"].fillna(0).astype(int)
-    out["Total"] = out[["Consultation", "Medicines", "Procedure", "Other"]].sum(axis=1)
-    out["Avg_per_Visit"] = (
-        (out["Total"] / out["Visits"].replace(0, pd.NA))
-        .round(0)
-        .fillna(0)
-        .astype(int)
-    )
-
-    out = out.sort_values([doc_col, "Year", "MonthNum"]).reset_index(drop=True)
-    out = out.rename(columns={doc_col: "DocName"})  # standardize for viewer
-    out.attrs["amt_col_used"] = amt_col  # keep a hint for the UI
-    out.attrs["group_col_used"] = group_col
-    return out
-
-def to_excel_bytes(df, sheet="Doctor_Summary"):
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as xw:
-        df.to_excel(xw, index=False, sheet_name=sheet)
-    return buf.getvalue()
-
-def render_bucket_debug(raw_df: pd.DataFrame, processed_df: pd.DataFrame, group_col: str, amt_col: str):
-    """Show which Item Groups are still mapped as OTHER (top 50 by amount)."""
-    with st.expander("Bucket debug — groups currently mapped as OTHER"):
-        df = normalize_cols(raw_df)
-        gc = group_col
-        ac = amt_col
-        if gc not in df.columns or ac not in df.columns:
-            st.info("Source columns not available for debugging.")
-            return
-        tmp = df.copy()
-        tmp["Bucket"] = tmp[gc].apply(categorize_group)
-        tmp[ac] = pd.to_numeric(tmp[ac], errors="coerce").fillna(0)
-        dbg = (
-            tmp.loc[tmp["Bucket"]=="Other", [gc, ac]]
-               .groupby(gc, dropna=False)[ac]
-               .agg(lines="count", amount="sum")
-               .sort_values("amount", ascending=False)
-               .head(50)
-        )
-        st.write(dbg)
-
-# ================== UI HELPERS ==================
-def render_center_view(center_key: str):
-    """Doctor dropdown + month table + download for the selected center."""
-    data = st.session_state["center_data"].get(center_key)
-    if data is None or (isinstance(data, pd.DataFrame) and data.empty):
-        st.info(f"No processed data for {CENTERS[center_key]} yet. Turn ON Admin, upload and click Process.")
-        return
-
-    doctors = sorted(pd.Series(data["DocName"]).dropna().astype(str).unique().tolist())
-    selected = st.selectbox("Select Doctor", doctors, index=0, key=f"doc_select_{center_key}")
-
-    view = data.loc[data["DocName"] == selected, [
-        "Year","Month","Consultation","Medicines","Procedure","Other","Total","Visits","Avg_per_Visit","MonthNum"
-    ]].copy()
-    view = view.sort_values(["Year","MonthNum"]).reset_index(drop=True)
-
-    # display 2024 not 2,024
-    view["Year"] = view["Year"].fillna(0).astype("Int64").astype(str)
-
-    st.success(f"Doctor: **{selected}** — {CENTERS[center_key]}")
-    st.dataframe(
-        view[["Year","Month","Consultation","Medicines","Procedure","Other","Total","Visits","Avg_per_Visit"]],
-        use_container_width=True
-    )
-
-    st.download_button(
-        f"Download Selected Doctor ({CENTERS[center_key]})",
-        data=to_excel_bytes(view.drop(columns=["MonthNum"]), sheet=selected[:30]),
-        file_name=f"doc_performance_{center_key}_{selected}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True,
-    )
-
-# ================== LAYOUT ==================
-mode = st.toggle("Admin mode", value=False, help="ON = upload & process; OFF = view")
-
-st.subheader("Select Center")
-center_key = st.radio("Center", list(CENTERS.keys()), format_func=lambda k: CENTERS[k], horizontal=True)
-
-if mode:
-    st.subheader(f"Admin — Upload & Process ({CENTERS[center_key]})")
-    up = st.file_uploader(
-        f"Upload Excel (.xlsx) for {CENTERS[center_key]}",
-        type=["xlsx"],
-        key=f"uploader_{center_key}"
-    )
-    c1, c2, c3 = st.columns([1,1,2])
-    if c1.button("Process", type="primary", use_container_width=True, key=f"process_{center_key}"):
-        if not up:
-            st.error("Please upload a file first.")
-        else:
-            try:
-                source_df = load_excel(up)
-                result_df = process_file(source_df)
-                st.session_state["center_data"][center_key] = result_df
-                save_center_to_disk(center_key, result_df)
-                st.success(f"✅ Processed and saved for {CENTERS[center_key]}.")
-                # bucket debug
-                amt_col_used = result_df.attrs.get("amt_col_used", "Amount")
-                group_col_used = result_df.attrs.get("group_col_used", "Item Group")
-                render_bucket_debug(source_df, result_df, group_col_used, amt_col_used)
-            except Exception as e:
-                st.error(f"Error: {e}")
-
-    if c2.button("Clear saved data", use_container_width=True, key=f"clear_{center_key}"):
-        st.session_state["center_data"][center_key] = None
-        f = STORE / f"{center_key}.csv"
-        if f.exists():
-            f.unlink()
-        st.info(f"Cleared stored data for {CENTERS[center_key]}.")
-
-    st.subheader(f"Doctor Viewer — {CENTERS[center_key]}")
-    render_center_view(center_key)
-
-else:
-    st.subheader(f"Doctor Viewer — {CENTERS[center_key]}")
-    render_center_view(center_key)
-
-
-
-
+import calendar, functools, hashlib, io, re
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import python_calamine
+import streamlit as st
+import xlsxwriter
+
+try:
+    import polars as pl  # optional fast path for the aggregation
+except ImportError:
+    pl = None
+
+# copy-on-write: column assignment on sliced frames is safe without eager copies
+pd.set_option("mode.copy_on_write", True)
+
+# ================== PAGE CONFIG ==================
+st.set_page_config(page_title="Doctor Performance — Monthwise", layout="wide")
+st.title("Doctor Performance — Monthwise")
+
+# Centers
+CENTERS = {"easyhealth": "EasyHealth", "excellent": "Excellent"}
+
+# Storage folder to persist processed data (so View works after reload)
+BASE = Path(__file__).parent
+STORE = BASE / "processed"
+STORE.mkdir(parents=True, exist_ok=True)
+
+# ================== STORE (hydrate from disk) ==================
+def load_center_from_disk(center_key: str) -> pd.DataFrame | None:
+    f = STORE / f"{center_key}.parquet"
+    if f.exists():
+        try:
+            return pd.read_parquet(f, engine="pyarrow")
+        except Exception:
+            return None
+    legacy = STORE / f"{center_key}.csv"  # data persisted before the parquet switch
+    if legacy.exists():
+        try:
+            return pd.read_csv(legacy)
+        except Exception:
+            return None
+    return None
+
+def strip_attrs(df: pd.DataFrame) -> pd.DataFrame:
+    """Shallow copy without attrs — to_parquet JSON-encodes attrs, and ours
+    carry a DataFrame (the bucket-debug breakdown)."""
+    clean = df.copy(deep=False)
+    clean.attrs = {}
+    return clean
+
+def save_center_to_disk(center_key: str, df: pd.DataFrame):
+    strip_attrs(df).to_parquet(STORE / f"{center_key}.parquet", engine="pyarrow", compression="zstd")
+
+@st.cache_resource(show_spinner=False)
+def center_store() -> dict:
+    """Process-wide store: {center_key: {"data": df|None, "by_doc": dict|None, "doctors": list|None}}.
+
+    cache_resource hands back the same objects every rerun — no pickle/copy of
+    the DataFrames like session_state/cache_data would pay.
+    """
+    return {}
+
+def get_center_entry(center_key: str) -> dict:
+    store = center_store()
+    entry = store.get(center_key)
+    if entry is None:
+        entry = {"data": load_center_from_disk(center_key), "by_doc": None, "doctors": None}
+        store[center_key] = entry
+    return entry
+
+# ================== HELPERS ==================
+# month number -> "Jan".."Dec"; slot 0 is "" for missing/out-of-range
+MONTH_ABBR = np.array(list(calendar.month_abbr), dtype=object)
+
+@functools.lru_cache(maxsize=64)
+def _clean_headers(cols: tuple) -> tuple:
+    return tuple(" ".join(str(c).split()) for c in cols)
+
+def normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
+    cols = tuple(df.columns)
+    cleaned = _clean_headers(cols)
+    if cols == cleaned:  # already normalized — common on reruns
+        return df
+    df = df.copy(deep=False)  # headers only; don't duplicate the data buffers
+    df.columns = list(cleaned)
+    return df
+
+def header_lookup(df) -> dict:
+    """lowercased/stripped header -> original name, built once per frame."""
+    return {str(c).lower().strip(): c for c in df.columns}
+
+# candidate headers per required column, shared by process_file and the reader peek
+REQUIRED_COLUMNS = {
+    "visit":  ("VisitNo", "Visit No", "Visit_ID", "Visit Id"),
+    "date":   ("VisitDate", "Visit Date", "Date"),
+    "doc":    ("DocName", "Doc Name", "Doctor", "Doctor Name", "Provider", "Provider Name"),
+    "group":  ("Item Group", "ItemGroup", "Group"),
+    # prefer Net Amount if available; fallback to ActivityIns/Amount
+    "amount": ("Net Amount", "NetAmount", "ActivityIns", "Activity Ins", "Amount"),
+}
+
+def find_col(lookup: dict, *candidates):
+    """Case-insensitive exact; then heuristic for doctor/provider-like columns."""
+    for cand in candidates:
+        hit = lookup.get(str(cand).lower().strip())
+        if hit is not None:
+            return hit
+    for k, c in lookup.items():
+        k = k.replace(" ", "")
+        if any(tok in k for tok in ["docname", "doc", "doctor", "provider", "physician"]):
+            return c
+    return None
+
+def peek_usecols(xlsx_bytes: bytes) -> list | None:
+    """Resolve the five required headers from the first row so read_excel can
+    skip every other column. Returns None (read everything) when unsure."""
+    try:
+        wb = python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(xlsx_bytes))
+        rows = wb.get_sheet_by_index(0).to_python(nrows=1)
+        if not rows:
+            return None
+        headers = rows[0]
+        lookup = {c.lower().strip(): orig for c, orig in zip(_clean_headers(tuple(headers)), headers)}
+        picks = [find_col(lookup, *cands) for cands in REQUIRED_COLUMNS.values()]
+        if any(p is None for p in picks):
+            return None  # let process_file report the missing columns on the full frame
+        return list(dict.fromkeys(picks))
+    except Exception:
+        return None
+
+@st.cache_data(show_spinner=False)
+def load_excel(xlsx_bytes: bytes) -> pd.DataFrame:
+    # calamine (Rust) reads xlsx far faster and leaner than openpyxl; openpyxl stays for writing
+    return pd.read_excel(
+        io.BytesIO(xlsx_bytes), sheet_name=0, engine="calamine", usecols=peek_usecols(xlsx_bytes)
+    )
+
+@st.cache_data(show_spinner=False)
+def process_workbook(xlsx_bytes: bytes) -> pd.DataFrame:
+    """Read + aggregate, memoized on the raw upload bytes (shared across sessions)."""
+    return process_file(load_excel(xlsx_bytes))
+
+# ---------- Keyword mapping for Item Group → Bucket ----------
+CONSULTATION_KEYS = [
+    "consult", "opd", "follow up", "follow-up", "revisit", "tele", "teleconsult"
+]
+MEDICINE_KEYS = [
+    "medicine", "medicin", "drug", "pharmacy", "rx", "tablet", "capsule",
+    "syrup", "drops", "cream", "ointment", "spray", "suppository"
+]
+PROCEDURE_KEYS = [
+    "procedure", "proc", "injection", "inj", "iv", "infusion", "nebul",
+    "ecg", "dressing", "suturing", "removal", "x-ray", "xray", "ultrasound",
+    "usg", "physio", "cast", "lab sample", "venipuncture", "nebulization",
+    "ivf", "drip", "echo", "spirometry", "vaccin", "vaccine", "bandage"
+]
+
+BUCKETS = ["Consultation", "Medicines", "Procedure", "Other"]
+
+# one compiled alternation per bucket; priority order matches the keyword lists
+CONS_RE = re.compile("|".join(map(re.escape, CONSULTATION_KEYS)))
+MED_RE  = re.compile("|".join(map(re.escape, MEDICINE_KEYS)))
+PROC_RE = re.compile("|".join(map(re.escape, PROCEDURE_KEYS)))
+
+def categorize_groups(values: pd.Series) -> pd.Categorical:
+    """Bucket a whole column: vectorized keyword match over the distinct groups, then map."""
+    uniq = values.dropna().unique()
+    s = pd.Series(uniq).astype("string").str.lower()
+    # straight to category codes (3 == Other); skips building an object array of labels
+    codes = np.select(
+        [s.str.contains(CONS_RE), s.str.contains(MED_RE), s.str.contains(PROC_RE)],
+        [0, 1, 2],
+        default=3,
+    )
+    code_map = dict(zip(uniq, codes))
+    all_codes = values.map(code_map).fillna(3).astype("int8").to_numpy()
+    return pd.Categorical.from_codes(all_codes, categories=BUCKETS)
+
+# ================== CORE PROCESSOR ==================
+def summarize_polars(df: pd.DataFrame, doc_col: str, visit_col: str, amt_col: str) -> pd.DataFrame:
+    """Bucket sums + distinct visits fused into one lazy, multi-threaded polars pass."""
+    lf = pl.from_pandas(
+        df[[doc_col, "Year", "MonthNum", "Month", "Bucket", visit_col, amt_col]]
+    ).lazy()
+    # numeric VisitNo dedupes on its native dtype; only text keys need normalizing
+    if pd.api.types.is_numeric_dtype(df[visit_col]):
+        visit_key = pl.col(visit_col)
+    else:
+        visit_key = pl.col(visit_col).cast(pl.String).str.strip_chars()
+    agg = (
+        lf.group_by([doc_col, "Year", "MonthNum", "Month"])
+          .agg(
+              [pl.col(amt_col).filter(pl.col("Bucket") == b).sum().alias(b) for b in BUCKETS]
+              + [visit_key.n_unique().alias("Visits")]
+          )
+          .collect()
+    )
+    out = agg.to_pandas()
+    # polars hands categories back in physical order; restore lexical order so
+    # the final sort_values matches the pandas path
+    if isinstance(out[doc_col].dtype, pd.CategoricalDtype):
+        out[doc_col] = out[doc_col].cat.reorder_categories(sorted(out[doc_col].cat.categories))
+    return out
+
+def process_file(df_in: pd.DataFrame) -> pd.DataFrame:
+    """
+    Month-wise doctor summary with Total & Avg_per_Visit.
+    * Sum money on ALL lines (no global drop_duplicates).
+    * Visits = distinct VisitNo per (Doc, Year, Month).
+    * Robust Item Group → Bucket mapping.
+    """
+    df = normalize_cols(df_in)
+
+    lookup = header_lookup(df)
+    visit_col = find_col(lookup, *REQUIRED_COLUMNS["visit"])
+    date_col  = find_col(lookup, *REQUIRED_COLUMNS["date"])
+    doc_col   = find_col(lookup, *REQUIRED_COLUMNS["doc"])
+    group_col = find_col(lookup, *REQUIRED_COLUMNS["group"])
+    amt_col   = find_col(lookup, *REQUIRED_COLUMNS["amount"])
+
+    missing = [label for label, col in [
+        ("VisitNo", visit_col), ("VisitDate", date_col), ("DocName", doc_col),
+        ("Item Group", group_col), ("Amount (Net/ActivityIns)", amt_col)
+    ] if col is None]
+    if missing:
+        raise ValueError(f"Missing required column(s): {missing}")
+
+    # everything below only needs these five — don't drag a wide frame through it
+    # (no .copy(): with copy-on-write the slice shares buffers until a column changes)
+    df = df[[visit_col, date_col, doc_col, group_col, amt_col]]
+
+    # Dates → Year/Month (calamine/openpyxl often hand back datetime64 already — skip reparsing)
+    raw_dates = df[date_col]
+    if pd.api.types.is_datetime64_any_dtype(raw_dates):
+        dt = raw_dates
+    elif pd.api.types.is_numeric_dtype(raw_dates):
+        # Excel serial dates: days since 1899-12-30
+        dt = pd.to_datetime(raw_dates, unit="D", origin="1899-12-30", errors="coerce")
+    else:
+        try:
+            # ISO strings take the strict C parser; cache=True dedupes repeated values
+            dt = pd.to_datetime(raw_dates, format="ISO8601", cache=True)
+        except (ValueError, TypeError):
+            dt = pd.to_datetime(raw_dates, errors="coerce", cache=True)
+    month = dt.dt.month  # float64 with NaN wherever the date was invalid
+    # small nullable ints / fixed categories: the groupbys hash narrow codes, not 8-byte keys
+    df["Year"] = dt.dt.year.astype("Int16")
+    df["MonthNum"] = month.astype("Int8")
+    mn = np.nan_to_num(month.to_numpy(dtype="float64"), nan=0.0).astype("int64")
+    df["Month"] = pd.Categorical(
+        MONTH_ABBR[np.where((mn >= 1) & (mn <= 12), mn, 0)], categories=list(MONTH_ABBR)
+    )
+    bad_dates = int(df["MonthNum"].isna().sum())
+    if bad_dates > 0:
+        st.warning(f"{bad_dates} row(s) had invalid VisitDate and were excluded from month buckets.")
+
+    # Amounts and Buckets
+    # float32 halves memory traffic through the aggregation; clinic-scale amounts
+    # fit comfortably inside its 24-bit mantissa and the UI rounds to whole units
+    df[amt_col] = pd.to_numeric(df[amt_col], errors="coerce").fillna(0).astype("float32")
+    # fixed categories: groupby hashes int codes, and unstack always emits all 4 columns
+    df["Bucket"] = categorize_groups(df[group_col])
+    # DocName is low-cardinality: categorical codes hash as ints in both groupbys
+    df[doc_col] = df[doc_col].astype("category")
+
+    ok = df["MonthNum"].notna()
+    if pl is not None:
+        # one fused pass over the frame: bucket sums + distinct visits per group
+        out = summarize_polars(df.loc[ok], doc_col, visit_col, amt_col)
+    else:
+        # --- AMOUNTS: sum ALL lines by Doc × Year × Month × Bucket ---
+        amounts = (
+            df.loc[ok]
+              .groupby([doc_col, "Year", "MonthNum", "Month", "Bucket"], sort=False, observed=True)[amt_col]
+              .sum()
+              .unstack("Bucket", fill_value=0)
+              .reindex(columns=BUCKETS, fill_value=0)
+        )
+
+        # --- VISITS: distinct VisitNo per group ---
+        vdf = df.loc[ok, [doc_col, "Year", "MonthNum", "Month", visit_col]].copy()
+        if not pd.api.types.is_numeric_dtype(vdf[visit_col]):
+            # normalize text keys in Arrow-backed string dtype — strip runs in
+            # Arrow compute, no per-row PyObject str allocations; numeric VisitNo
+            # hashes faster on its native dtype
+            vdf[visit_col] = vdf[visit_col].astype("string[pyarrow]").str.strip()
+        # distinct VisitNo per group: dedupe once, then a plain size() — avoids the
+        # per-group set building inside SeriesGroupBy.nunique
+        visits = (
+            vdf.dropna(subset=[visit_col])
+               .drop_duplicates()
+               .groupby([doc_col, "Year", "MonthNum", "Month"], sort=False, observed=True)
+               .size()
+               .rename("Visits")
+        )
+
+        # Join on the shared group index (no second hash merge)
+        out = amounts.join(visits).reset_index()
+    out["Visits"] = out["Visits"].fillna(0).astype(int)
+    # raw ndarray row sum — pandas' axis=1 reduction path is far slower
+    out["Total"] = out[BUCKETS].to_numpy().sum(axis=1)
+    # zero-guarded divide in one numpy pass — where= skips the zero-visit lanes
+    # entirely (out= supplies the 0 default) instead of dividing then masking
+    total = out["Total"].to_numpy(dtype="float64")
+    visits = out["Visits"].to_numpy(dtype="float64")
+    avg = np.divide(total, visits, out=np.zeros_like(total), where=visits != 0)
+    out["Avg_per_Visit"] = np.rint(avg).astype("int64")
+
+    # the only sort in the pipeline — every groupby above runs with sort=False
+    out = out.sort_values([doc_col, "Year", "MonthNum"], kind="stable").reset_index(drop=True)
+    out = out.rename(columns={doc_col: "DocName"})  # standardize for viewer
+    out.attrs["amt_col_used"] = amt_col  # keep a hint for the UI
+    out.attrs["group_col_used"] = group_col
+    # stash the OTHER breakdown for the admin debug expander, reusing the Bucket
+    # column just built instead of re-categorizing the raw file later
+    out.attrs["other_groups"] = (
+        df.loc[df["Bucket"] == "Other", [group_col, amt_col]]
+          .groupby(group_col, dropna=False, sort=False, observed=True)[amt_col]
+          .agg(lines="count", amount="sum")
+          .sort_values("amount", ascending=False)
+          .head(50)
+    )
+    return out
+
+def to_excel_bytes(df, sheet="Doctor_Summary"):
+    # constant_memory flushes each row as it is written, so peak RAM stays O(one row).
+    # That requires strict row order, so rows are emitted directly instead of via
+    # df.to_excel (pandas writes column-major, which constant_memory would drop).
+    buf = io.BytesIO()
+    with xlsxwriter.Workbook(
+        buf, {"constant_memory": True, "strings_to_urls": False}
+    ) as wb:
+        ws = wb.add_worksheet(sheet[:31])
+        ws.write_row(0, 0, [str(c) for c in df.columns])
+        for i, row in enumerate(df.itertuples(index=False, name=None), start=1):
+            ws.write_row(i, 0, [None if pd.isna(v) else v for v in row])
+    return buf.getvalue()
+
+def render_bucket_debug(processed_df: pd.DataFrame):
+    """Show which Item Groups are still mapped as OTHER (top 50 by amount)."""
+    with st.expander("Bucket debug — groups currently mapped as OTHER"):
+        dbg = processed_df.attrs.get("other_groups")
+        if dbg is None:
+            st.info("Debug info not available for this dataset.")
+            return
+        st.write(dbg)
+
+# ================== UI HELPERS ==================
+def split_by_doctor(df: pd.DataFrame) -> dict:
+    """Pre-sorted frame per doctor, built once so doctor switches are dict hits."""
+    return {
+        str(name): sub.sort_values(["Year", "MonthNum"]).reset_index(drop=True)
+        for name, sub in df.groupby("DocName", sort=False, observed=True)
+    }
+
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """Cheap content hash of a processed frame, memoized on the frame itself."""
+    fp = df.attrs.get("fingerprint")
+    if fp is None:
+        fp = str(pd.util.hash_pandas_object(df, index=False).sum())
+        df.attrs["fingerprint"] = fp
+    return fp
+
+@st.cache_data(show_spinner=False)
+def doctor_xlsx_bytes(center_key: str, doctor: str, fingerprint: str) -> bytes:
+    """Serialize one doctor's table once per (doctor, dataset) instead of every rerun."""
+    view = get_center_entry(center_key)["by_doc"][doctor]
+    cols = ["Year","Month","Consultation","Medicines","Procedure","Other","Total","Visits","Avg_per_Visit"]
+    return to_excel_bytes(view[cols], sheet=doctor[:30])
+
+EXPORT_MIMES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/octet-stream",
+}
+
+@st.cache_data(show_spinner=False)
+def center_export_bytes(center_key: str, fmt: str, fingerprint: str) -> bytes:
+    """Full summary for a center, serialized once per (format, dataset).
+
+    csv/parquet cost a fraction of the xlsx encode for bulk exports."""
+    df = get_center_entry(center_key)["data"]
+    if fmt == "csv":
+        return df.to_csv(index=False).encode()
+    if fmt == "parquet":
+        buf = io.BytesIO()
+        strip_attrs(df).to_parquet(buf, engine="pyarrow", compression="zstd")
+        return buf.getvalue()
+    return to_excel_bytes(df)
+
+@st.fragment
+def render_center_view(center_key: str):
+    """Doctor dropdown + month table + download for the selected center.
+
+    Runs as a fragment: switching doctors reruns only this block instead of
+    the whole script (tab bar, admin controls, both center views).
+    """
+    entry = get_center_entry(center_key)
+    data = entry["data"]
+    if data is None or (isinstance(data, pd.DataFrame) and data.empty):
+        st.info(f"No processed data for {CENTERS[center_key]} yet. Turn ON Admin, upload and click Process.")
+        return
+
+    if entry["by_doc"] is None:
+        entry["by_doc"] = split_by_doctor(data)
+        entry["doctors"] = sorted(entry["by_doc"])
+    slices = entry["by_doc"]
+
+    doctors = entry["doctors"]
+    selected = st.selectbox("Select Doctor", doctors, index=0, key=f"doc_select_{center_key}")
+
+    cols = ["Year","Month","Consultation","Medicines","Procedure","Other","Total","Visits","Avg_per_Visit"]
+    view = slices[selected][cols]
+
+    st.success(f"Doctor: **{selected}** — {CENTERS[center_key]}")
+    st.dataframe(
+        view,
+        use_container_width=True,
+        # plain integer rendering (2024, not 2,024) without materializing strings
+        column_config={c: st.column_config.NumberColumn(format="%d") for c in cols if c != "Month"},
+    )
+
+    st.download_button(
+        f"Download Selected Doctor ({CENTERS[center_key]})",
+        data=doctor_xlsx_bytes(center_key, selected, data_fingerprint(data)),
+        file_name=f"doc_performance_{center_key}_{selected}.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        use_container_width=True,
+    )
+
+# ================== LAYOUT ==================
+mode = st.toggle("Admin mode", value=False, help="ON = upload & process; OFF = view")
+
+st.subheader("Select Center")
+center_key = st.radio("Center", list(CENTERS.keys()), format_func=lambda k: CENTERS[k], horizontal=True)
+
+if mode:
+    st.subheader(f"Admin — Upload & Process ({CENTERS[center_key]})")
+    up = st.file_uploader(
+        f"Upload Excel (.xlsx) for {CENTERS[center_key]}",
+        type=["xlsx"],
+        key=f"uploader_{center_key}"
+    )
+    c1, c2, c3 = st.columns([1,1,2])
+    if c1.button("Process", type="primary", use_container_width=True, key=f"process_{center_key}"):
+        if not up:
+            st.error("Please upload a file first.")
+        else:
+            try:
+                raw_bytes = up.getvalue()
+                # blake2b of the upload: survives cache eviction, skips everything on a re-click
+                file_hash = hashlib.blake2b(raw_bytes, digest_size=16).hexdigest()
+                entry = get_center_entry(center_key)
+                if st.session_state.get(f"last_hash_{center_key}") == file_hash and entry["data"] is not None:
+                    st.info(f"This file is already processed for {CENTERS[center_key]} — nothing to redo.")
+                    render_bucket_debug(entry["data"])
+                else:
+                    result_df = process_workbook(raw_bytes)
+                    entry["data"] = result_df
+                    entry["by_doc"] = None
+                    entry["doctors"] = None
+                    save_center_to_disk(center_key, result_df)
+                    st.session_state[f"last_hash_{center_key}"] = file_hash
+                    st.success(f"✅ Processed and saved for {CENTERS[center_key]}.")
+                    render_bucket_debug(result_df)
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    if c2.button("Clear saved data", use_container_width=True, key=f"clear_{center_key}"):
+        entry = get_center_entry(center_key)
+        entry["data"] = None
+        entry["by_doc"] = None
+        entry["doctors"] = None
+        for f in (STORE / f"{center_key}.parquet", STORE / f"{center_key}.csv"):
+            if f.exists():
+                f.unlink()
+        st.info(f"Cleared stored data for {CENTERS[center_key]}.")
+
+    full = get_center_entry(center_key)["data"]
+    if full is not None and not full.empty:
+        fmt = c3.radio(
+            "Full download format", list(EXPORT_MIMES), horizontal=True, key=f"full_fmt_{center_key}"
+        )
+        # bytes come from the per-(format, dataset) cache, so reruns don't re-serialize
+        c3.download_button(
+            f"Download FULL ({CENTERS[center_key]})",
+            data=center_export_bytes(center_key, fmt, data_fingerprint(full)),
+            file_name=f"doc_performance_{center_key}_full.{fmt}",
+            mime=EXPORT_MIMES[fmt],
+            use_container_width=True,
+            key=f"full_dl_{center_key}",
+        )
+
+    st.subheader(f"Doctor Viewer — {CENTERS[center_key]}")
+    render_center_view(center_key)
+
+else:
+    st.subheader(f"Doctor Viewer — {CENTERS[center_key]}")
+    render_center_view(center_key)
+
+
+
+